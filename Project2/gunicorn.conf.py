@@ -0,0 +1,14 @@
+"""
+Shared gunicorn settings for Parts A and B (read from the working directory).
+
+Threaded workers let each process keep serving while other requests sit in
+blocking S3 / DynamoDB / MongoDB calls.
+"""
+
+import multiprocessing
+
+bind           = "0.0.0.0:5000"
+worker_class   = "gthread"
+workers        = multiprocessing.cpu_count()
+threads        = 8
+worker_tmp_dir = "/dev/shm"
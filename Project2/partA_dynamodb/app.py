@@ -4,15 +4,24 @@ Backend : Amazon DynamoDB  +  Amazon S3
 Web     : Python / Flask
 """
 
-import os, uuid, hashlib, datetime
+import os, uuid, hashlib, hmac, datetime, threading, time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
 import boto3
-from boto3.dynamodb.conditions import Attr
+from boto3.s3.transfer import TransferConfig
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+import redis
+from cachetools import TTLCache
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, session, flash, send_file,
+    url_for, session, flash, Response,
 )
+from flask_session import Session
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 
@@ -27,7 +36,35 @@ app = Flask(
 )
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key")
 
+# Server-side sessions in Redis, shared by every worker; the cookie only
+# carries the signed session id.
+app.config.update(
+    SESSION_TYPE="redis",
+    SESSION_REDIS=redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")),
+    SESSION_USE_SIGNER=True,
+)
+Session(app)
+
 ALLOWED_EXT = {"png", "jpg", "jpeg", "gif", "bmp", "webp"}
+UPLOAD_WORKERS = 8
+TRANSFER_CONCURRENCY = 16
+DOWNLOAD_URL_TTL = 300
+# Relay downloads through Flask (e.g. when clients cannot reach S3 directly).
+PROXY_DOWNLOADS = os.getenv("PROXY_DOWNLOADS", "false").lower() == "true"
+
+# ── User cache ───────────────────────────────────────────────────────────────
+USER_CACHE_TTL = 600
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+_user_lock  = threading.Lock()
+
+# ── Signed URL cache ─────────────────────────────────────────────────────────
+# Entries expire a minute before the URL does, so a cached link always has at
+# least that long left when it is rendered.
+SIGNED_URL_TTL = 3600
+_url_cache = TTLCache(maxsize=10_000, ttl=SIGNED_URL_TTL - 60)
+_url_lock  = threading.Lock()
+
+_ph = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
 
 # ── AWS clients ──────────────────────────────────────────────────────────────
 _aws = dict(
@@ -35,41 +72,168 @@ _aws = dict(
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
 )
-dynamodb = boto3.resource("dynamodb", **_aws)
-s3_client = boto3.client("s3", **_aws)
+# Pool large enough for every multipart part of a full upload batch
+# (UPLOAD_WORKERS files x TRANSFER_CONCURRENCY parts each); adaptive retries
+# back off on throttling.
+_boto_cfg = Config(
+    max_pool_connections=UPLOAD_WORKERS * TRANSFER_CONCURRENCY,
+    retries={"mode": "adaptive", "max_attempts": 5},
+)
+# One session for the whole process; the client/resource built from it are
+# shared by every request handler and worker thread.
+_boto_session = boto3.session.Session(**_aws)
+dynamodb = _boto_session.resource("dynamodb", config=_boto_cfg)
+s3_client = _boto_session.client("s3", config=_boto_cfg)
+# Fewer, larger parts than boto3's defaults (8 MiB, 10 threads) so big
+# RAW/HEIC files spend less time on per-part request overhead.
+_transfer_cfg = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=TRANSFER_CONCURRENCY,
+    use_threads=True,
+)
 
 S3_BUCKET   = os.getenv("S3_BUCKET_NAME", "se422-photo-gallery-bucket")
 TBL_USERS   = os.getenv("DYNAMO_USERS_TABLE", "PhotoGalleryUsers")
 TBL_PHOTOS  = os.getenv("DYNAMO_PHOTOS_TABLE", "PhotoGalleryPhotos")
+IDX_USER    = "username-uploaded_at-index"
+
+# Only the attributes the gallery/search cards render.
+PHOTO_FIELDS = ("photo_id", "filename", "s3_key", "tags", "description", "uploaded_at")
 
 
 # ── Helpers ──────────────────────────────────────────────────────────────────
 def _pw(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+    return _ph.hash(password)
+
+
+def _check_pw(user: dict, password: str) -> bool:
+    """Verify a login, upgrading legacy SHA-256 or outdated Argon2 hashes."""
+    stored = user["password"]
+    if stored.startswith("$argon2"):
+        try:
+            _ph.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        stale = _ph.check_needs_rehash(stored)
+    else:
+        # Accounts created before Argon2 hold an unsalted SHA-256 digest.
+        if not hmac.compare_digest(stored, hashlib.sha256(password.encode()).hexdigest()):
+            return False
+        stale = True
+    if stale:
+        new_hash = _pw(password)
+        users_tbl.update_item(
+            Key={"username": user["username"]},
+            UpdateExpression="SET #pw = :pw",
+            ExpressionAttributeNames={"#pw": "password"},
+            ExpressionAttributeValues={":pw": new_hash},
+        )
+        user["password"] = new_hash
+    return True
 
 
 def _ok_file(name: str) -> bool:
     return "." in name and name.rsplit(".", 1)[1].lower() in ALLOWED_EXT
 
 
-def _init_tables():
-    existing = {t.name for t in dynamodb.tables.all()}
-    if TBL_USERS not in existing:
-        dynamodb.create_table(
-            TableName=TBL_USERS,
-            KeySchema=[{"AttributeName": "username", "KeyType": "HASH"}],
-            AttributeDefinitions=[{"AttributeName": "username", "AttributeType": "S"}],
-            BillingMode="PAY_PER_REQUEST",
+def _upload_s3(body, content_type: str, key: str) -> None:
+    s3_client.upload_fileobj(
+        body, S3_BUCKET, key,
+        ExtraArgs={"ContentType": content_type},
+        Config=_transfer_cfg,
+    )
+
+
+def _check_tables():
+    """Fail fast when setup_tables.py has not been run (or is still running)."""
+    try:
+        dynamodb.Table(TBL_USERS).load()
+        indexes = dynamodb.Table(TBL_PHOTOS).global_secondary_indexes or []
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ResourceNotFoundException":
+            raise
+        indexes = []
+    status = next((i["IndexStatus"] for i in indexes if i["IndexName"] == IDX_USER), None)
+    if status != "ACTIVE":
+        raise RuntimeError(
+            f"DynamoDB tables are not ready (index {IDX_USER}: {status or 'missing'}); "
+            "run 'python partA_dynamodb/setup_tables.py' first."
         )
-        dynamodb.Table(TBL_USERS).wait_until_exists()
-    if TBL_PHOTOS not in existing:
-        dynamodb.create_table(
-            TableName=TBL_PHOTOS,
-            KeySchema=[{"AttributeName": "photo_id", "KeyType": "HASH"}],
-            AttributeDefinitions=[{"AttributeName": "photo_id", "AttributeType": "S"}],
-            BillingMode="PAY_PER_REQUEST",
+
+
+def _get_user(username: str):
+    """User record, cached for USER_CACHE_TTL seconds once found."""
+    # Misses are not cached: register() only reaches its own worker's cache,
+    # so a cached miss could hide a new account from the other workers.
+    with _user_lock:
+        user = _user_cache.get(username)
+    if user is None:
+        user = users_tbl.get_item(Key={"username": username}).get("Item")
+        if user:
+            with _user_lock:
+                _user_cache[username] = user
+    return user
+
+
+def _user_photos(username: str) -> list:
+    """All of a user's photos, newest first, via the username GSI."""
+    items, last_key = [], None
+    while True:
+        kwargs = dict(
+            IndexName=IDX_USER,
+            KeyConditionExpression=Key("username").eq(username),
+            ScanIndexForward=False,
+            ProjectionExpression=", ".join(f"#f{i}" for i in range(len(PHOTO_FIELDS))),
+            ExpressionAttributeNames={f"#f{i}": f for i, f in enumerate(PHOTO_FIELDS)},
+        )
+        if last_key:
+            kwargs["ExclusiveStartKey"] = last_key
+        resp = photos_tbl.query(**kwargs)
+        items.extend(resp.get("Items", []))
+        last_key = resp.get("LastEvaluatedKey")
+        if not last_key:
+            break
+    return items
+
+
+@app.template_filter("date")
+def date_filter(ts) -> str:
+    """YYYY-MM-DD (UTC) for an epoch-ms timestamp."""
+    return datetime.datetime.fromtimestamp(int(ts) / 1000, datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+@app.template_filter("signed_url")
+def signed_url(key: str) -> str:
+    """Presigned GET URL for an S3 key, reused until close to expiry."""
+    with _url_lock:
+        url = _url_cache.get(key)
+    if url is None:
+        url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": S3_BUCKET, "Key": key},
+            ExpiresIn=SIGNED_URL_TTL,
         )
-        dynamodb.Table(TBL_PHOTOS).wait_until_exists()
+        with _url_lock:
+            _url_cache[key] = url
+    return url
+
+
+def _stream_s3(item: dict) -> Response:
+    """Relay an S3 object in 64 KiB chunks rather than buffering all of it."""
+    obj = s3_client.get_object(Bucket=S3_BUCKET, Key=item["s3_key"])
+
+    def gen(body=obj["Body"]):
+        try:
+            yield from iter(lambda: body.read(65536), b"")
+        finally:
+            body.close()
+
+    return Response(gen(), headers={
+        "Content-Type": obj["ContentType"],
+        "Content-Disposition": f'attachment; filename="{item["filename"]}"',
+        "Content-Length": str(obj["ContentLength"]),
+    })
 
 
 def _init_bucket():
@@ -87,7 +251,7 @@ def _init_bucket():
 
 
 # ── Bootstrap ────────────────────────────────────────────────────────────────
-_init_tables()
+_check_tables()
 _init_bucket()
 
 users_tbl  = dynamodb.Table(TBL_USERS)
@@ -132,9 +296,8 @@ def login():
     if request.method == "POST":
         username = request.form["username"].strip()
         password = request.form["password"].strip()
-        resp = users_tbl.get_item(Key={"username": username})
-        user = resp.get("Item")
-        if user and user["password"] == _pw(password):
+        user = _get_user(username)
+        if user and _check_pw(user, password):
             session["username"] = username
             flash(f"Welcome back, {username}!", "success")
             return redirect(url_for("gallery"))
@@ -155,8 +318,7 @@ def gallery():
     if "username" not in session:
         return redirect(url_for("login"))
     username = session["username"]
-    items = photos_tbl.scan(FilterExpression=Attr("username").eq(username)).get("Items", [])
-    items.sort(key=lambda p: p.get("uploaded_at", ""), reverse=True)
+    items = _user_photos(username)
     return render_template("gallery.html", photos=items, username=username)
 
 
@@ -172,27 +334,47 @@ def upload():
             return redirect(url_for("upload"))
         tags = request.form.get("tags", "").strip()
         desc = request.form.get("description", "").strip()
-        count = 0
+        username = session["username"]
+        # Werkzeug streams are not thread-safe, so each file is buffered
+        # before its S3 upload is handed to the pool.
+        pending = []
         for f in files:
             if f and _ok_file(f.filename):
                 safe = secure_filename(f.filename)
                 pid  = str(uuid.uuid4())
-                key  = f"photos/{session['username']}/{pid}_{safe}"
-                s3_client.upload_fileobj(
-                    f.stream, S3_BUCKET, key,
-                    ExtraArgs={"ContentType": f.content_type},
-                )
-                photos_tbl.put_item(Item={
+                pending.append((BytesIO(f.read()), f.content_type, {
                     "photo_id": pid,
-                    "username": session["username"],
+                    "username": username,
                     "filename": safe,
-                    "s3_key": key,
+                    "s3_key": f"photos/{username}/{pid}_{safe}",
                     "tags": tags,
                     "description": desc,
-                    "uploaded_at": datetime.datetime.utcnow().isoformat(),
-                })
-                count += 1
-        flash(f"Uploaded {count} photo(s).", "success")
+                    "uploaded_at": int(time.time() * 1000),
+                }))
+        if not pending:
+            flash("No supported image files selected.", "danger")
+            return redirect(url_for("upload"))
+        # Metadata is written only for files that reached S3, so one failed
+        # upload doesn't sink the rest of the batch.
+        uploaded, failed = [], []
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as ex:
+            futures = {
+                ex.submit(_upload_s3, body, ct, meta["s3_key"]): meta
+                for body, ct, meta in pending
+            }
+        for fut, meta in futures.items():
+            if fut.exception():
+                app.logger.warning("S3 upload failed for %s: %s", meta["s3_key"], fut.exception())
+                failed.append(meta)
+            else:
+                uploaded.append(meta)
+        with photos_tbl.batch_writer() as bw:
+            for meta in uploaded:
+                bw.put_item(Item=meta)
+        if uploaded:
+            flash(f"Uploaded {len(uploaded)} photo(s).", "success")
+        if failed:
+            flash("Failed to upload: " + ", ".join(m["filename"] for m in failed), "danger")
         return redirect(url_for("gallery"))
     return render_template("upload.html")
 
@@ -206,7 +388,7 @@ def search():
     username = session["username"]
     if not q:
         return render_template("search.html", photos=[], query="")
-    items = photos_tbl.scan(FilterExpression=Attr("username").eq(username)).get("Items", [])
+    items = _user_photos(username)
     results = [
         p for p in items
         if q in p.get("filename", "").lower()
@@ -225,8 +407,19 @@ def download(photo_id):
     if not item or item["username"] != session["username"]:
         flash("Photo not found.", "danger")
         return redirect(url_for("gallery"))
-    obj = s3_client.get_object(Bucket=S3_BUCKET, Key=item["s3_key"])
-    return send_file(BytesIO(obj["Body"].read()), download_name=item["filename"], as_attachment=True)
+    if PROXY_DOWNLOADS:
+        return _stream_s3(item)
+    # Hand the client a short-lived S3 link instead of proxying the bytes.
+    url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": S3_BUCKET,
+            "Key": item["s3_key"],
+            "ResponseContentDisposition": f'attachment; filename="{item["filename"]}"',
+        },
+        ExpiresIn=DOWNLOAD_URL_TTL,
+    )
+    return redirect(url)
 
 
 # ── Delete ───────────────────────────────────────────────────────────────────
@@ -239,6 +432,8 @@ def delete(photo_id):
         flash("Photo not found.", "danger")
         return redirect(url_for("gallery"))
     s3_client.delete_object(Bucket=S3_BUCKET, Key=item["s3_key"])
+    with _url_lock:
+        _url_cache.pop(item["s3_key"], None)
     photos_tbl.delete_item(Key={"photo_id": photo_id})
     flash("Photo deleted.", "success")
     return redirect(url_for("gallery"))
@@ -246,4 +441,4 @@ def delete(photo_id):
 
 # ── Entry point ──────────────────────────────────────────────────────────────
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000, debug=False)
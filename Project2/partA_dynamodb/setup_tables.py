@@ -0,0 +1,149 @@
+"""
+Part A  –  One-off DynamoDB setup
+
+Creates the Users and Photos tables (with the username/uploaded_at GSI the
+app queries), or upgrades tables from an older deployment: legacy ISO-8601
+uploaded_at strings are rewritten as epoch milliseconds and the GSI is
+added. Waits until the GSI is ACTIVE, so the app can be started as soon as
+this returns.
+
+Run once before starting the app (safe to re-run):
+    python partA_dynamodb/setup_tables.py
+"""
+
+import os, datetime, time
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from dotenv import load_dotenv
+
+# ── Config ───────────────────────────────────────────────────────────────────
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+_aws = dict(
+    region_name=os.getenv("AWS_REGION", "us-east-1"),
+    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+)
+dynamodb = boto3.session.Session(**_aws).resource("dynamodb")
+
+TBL_USERS  = os.getenv("DYNAMO_USERS_TABLE", "PhotoGalleryUsers")
+TBL_PHOTOS = os.getenv("DYNAMO_PHOTOS_TABLE", "PhotoGalleryPhotos")
+IDX_USER   = "username-uploaded_at-index"
+
+# GSI backfill time grows with table size; give up rather than hang forever.
+INDEX_WAIT_SECS = int(os.getenv("DYNAMO_INDEX_WAIT_SECS", "1800"))
+
+USER_IDX = {
+    "IndexName": IDX_USER,
+    "KeySchema": [
+        {"AttributeName": "username", "KeyType": "HASH"},
+        {"AttributeName": "uploaded_at", "KeyType": "RANGE"},
+    ],
+    "Projection": {"ProjectionType": "ALL"},
+}
+USER_ATTRS = [
+    {"AttributeName": "username", "AttributeType": "S"},
+    {"AttributeName": "uploaded_at", "AttributeType": "N"},
+]
+
+
+def _epoch_ms(iso: str) -> int:
+    return int(datetime.datetime.fromisoformat(iso)
+               .replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def upgrade_timestamps(tbl) -> int:
+    """Rewrite legacy ISO-8601 uploaded_at strings as epoch milliseconds."""
+    count, last_key = 0, None
+    with tbl.batch_writer() as bw:
+        while True:
+            kwargs = {"FilterExpression": Attr("uploaded_at").attribute_type("S")}
+            if last_key:
+                kwargs["ExclusiveStartKey"] = last_key
+            resp = tbl.scan(**kwargs)
+            for item in resp.get("Items", []):
+                item["uploaded_at"] = _epoch_ms(item["uploaded_at"])
+                bw.put_item(Item=item)
+                count += 1
+            last_key = resp.get("LastEvaluatedKey")
+            if not last_key:
+                break
+    return count
+
+
+def wait_for_index(tbl):
+    """Block until the username GSI is ACTIVE, or raise after INDEX_WAIT_SECS."""
+    deadline = time.monotonic() + INDEX_WAIT_SECS
+    while True:
+        tbl.reload()
+        status = next(
+            (i["IndexStatus"] for i in tbl.global_secondary_indexes or []
+             if i["IndexName"] == IDX_USER),
+            None,
+        )
+        if status == "ACTIVE":
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                f"{IDX_USER} on {TBL_PHOTOS} is {status or 'missing'} "
+                f"after {INDEX_WAIT_SECS}s."
+            )
+        time.sleep(5)
+
+
+def setup_users(existing: set):
+    if TBL_USERS in existing:
+        print(f"[1/2] Table '{TBL_USERS}' already exists.")
+        return
+    print(f"[1/2] Creating table '{TBL_USERS}' …")
+    dynamodb.create_table(
+        TableName=TBL_USERS,
+        KeySchema=[{"AttributeName": "username", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "username", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.Table(TBL_USERS).wait_until_exists()
+
+
+def setup_photos(existing: set):
+    tbl = dynamodb.Table(TBL_PHOTOS)
+    if TBL_PHOTOS not in existing:
+        print(f"[2/2] Creating table '{TBL_PHOTOS}' …")
+        dynamodb.create_table(
+            TableName=TBL_PHOTOS,
+            KeySchema=[{"AttributeName": "photo_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "photo_id", "AttributeType": "S"}] + USER_ATTRS,
+            GlobalSecondaryIndexes=[USER_IDX],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        tbl.wait_until_exists()
+    else:
+        print(f"[2/2] Table '{TBL_PHOTOS}' already exists.")
+        types = {a["AttributeName"]: a["AttributeType"] for a in tbl.attribute_definitions}
+        if types.get("uploaded_at") == "S":
+            raise RuntimeError(
+                f"{TBL_PHOTOS} indexes uploaded_at as a string; delete "
+                f"{IDX_USER} (or the table) so it can be rebuilt with epoch-ms timestamps."
+            )
+        # Tables created before the GSI existed need it added in place.
+        if not any(i["IndexName"] == IDX_USER for i in tbl.global_secondary_indexes or []):
+            print(f"      Converted {upgrade_timestamps(tbl)} legacy timestamp(s).")
+            print(f"      Adding index '{IDX_USER}' …")
+            tbl.update(
+                AttributeDefinitions=USER_ATTRS,
+                GlobalSecondaryIndexUpdates=[{"Create": USER_IDX}],
+            )
+    print(f"      Waiting for '{IDX_USER}' to become ACTIVE …")
+    wait_for_index(tbl)
+
+
+def main():
+    existing = {t.name for t in dynamodb.tables.all()}
+    setup_users(existing)
+    setup_photos(existing)
+    print("DynamoDB setup complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+Part A  –  DynamoDB app entry point for gunicorn:
+
+    gunicorn --chdir partA_dynamodb wsgi:app
+"""
+
+from app import app  # noqa: F401
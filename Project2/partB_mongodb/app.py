@@ -4,15 +4,24 @@ Backend : MongoDB  +  Amazon S3
 Web     : Python / Flask
 """
 
-import os, uuid, hashlib, datetime
+import os, uuid, hashlib, hmac, datetime, threading, time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
 import boto3
-from pymongo import MongoClient
+from boto3.s3.transfer import TransferConfig
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+import redis
+from cachetools import TTLCache
+from botocore.config import Config
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import OperationFailure
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, session, flash, send_file,
+    url_for, session, flash, Response,
 )
+from flask_session import Session
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 
@@ -27,7 +36,36 @@ app = Flask(
 )
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key")
 
+# Server-side sessions in Redis, shared by every worker; the cookie only
+# carries the signed session id.
+app.config.update(
+    SESSION_TYPE="redis",
+    SESSION_REDIS=redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")),
+    SESSION_USE_SIGNER=True,
+)
+Session(app)
+
 ALLOWED_EXT = {"png", "jpg", "jpeg", "gif", "bmp", "webp"}
+UPLOAD_WORKERS = 8
+TRANSFER_CONCURRENCY = 16
+GALLERY_PAGE_SIZE = 24
+DOWNLOAD_URL_TTL = 300
+# Relay downloads through Flask (e.g. when clients cannot reach S3 directly).
+PROXY_DOWNLOADS = os.getenv("PROXY_DOWNLOADS", "false").lower() == "true"
+
+# ── User cache ───────────────────────────────────────────────────────────────
+USER_CACHE_TTL = 600
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+_user_lock  = threading.Lock()
+
+# ── Signed URL cache ─────────────────────────────────────────────────────────
+# Entries expire a minute before the URL does, so a cached link always has at
+# least that long left when it is rendered.
+SIGNED_URL_TTL = 3600
+_url_cache = TTLCache(maxsize=10_000, ttl=SIGNED_URL_TTL - 60)
+_url_lock  = threading.Lock()
+
+_ph = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
 
 # ── AWS S3 (still used for photo file storage) ──────────────────────────────
 _aws = dict(
@@ -35,31 +73,182 @@ _aws = dict(
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
 )
-s3_client = boto3.client("s3", **_aws)
+# Pool large enough for every multipart part of a full upload batch
+# (UPLOAD_WORKERS files x TRANSFER_CONCURRENCY parts each); adaptive retries
+# back off on throttling.
+_boto_cfg = Config(
+    max_pool_connections=UPLOAD_WORKERS * TRANSFER_CONCURRENCY,
+    retries={"mode": "adaptive", "max_attempts": 5},
+)
+# One session for the whole process; the client/resource built from it are
+# shared by every request handler and worker thread.
+_boto_session = boto3.session.Session(**_aws)
+s3_client = _boto_session.client("s3", config=_boto_cfg)
+# Fewer, larger parts than boto3's defaults (8 MiB, 10 threads) so big
+# RAW/HEIC files spend less time on per-part request overhead.
+_transfer_cfg = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=TRANSFER_CONCURRENCY,
+    use_threads=True,
+)
 S3_BUCKET = os.getenv("S3_BUCKET_NAME", "se422-photo-gallery-bucket")
 
 # ── MongoDB ──────────────────────────────────────────────────────────────────
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB  = os.getenv("MONGO_DB_NAME", "photo_gallery")
-mongo     = MongoClient(MONGO_URI)
+# Pool covers every gthread worker thread plus upload bursts; fail fast when
+# the server is unreachable and compress wire traffic for bulky find()s.
+mongo     = MongoClient(
+    MONGO_URI,
+    maxPoolSize=200,
+    minPoolSize=10,
+    socketTimeoutMS=5000,
+    serverSelectionTimeoutMS=3000,
+    compressors="zstd,zlib",
+)
 db        = mongo[MONGO_DB]
 users_col  = db["users"]
 photos_col = db["photos"]
 
+# Only the fields the gallery/search cards render; _id is left out entirely.
+PHOTO_FIELDS = {f: 1 for f in ("photo_id", "filename", "s3_key", "tags", "description", "uploaded_at")}
+PHOTO_FIELDS["_id"] = 0
+
 users_col.create_index("username", unique=True)
-photos_col.create_index("username")
-photos_col.create_index("photo_id", unique=True)
+# (username, uploaded_at) serves the gallery sort straight from the index and
+# (username, photo_id) covers single-photo lookups, so the old single-field
+# indexes are dropped.
+for _stale in ("username_1", "photo_id_1"):
+    if _stale in photos_col.index_information():
+        try:
+            photos_col.drop_index(_stale)
+        except OperationFailure as e:
+            # Another gunicorn worker dropped it first (IndexNotFound).
+            if e.code != 27:
+                raise
+photos_col.create_index([("username", 1), ("uploaded_at", -1)], name="user_time_idx")
+photos_col.create_index([("username", 1), ("photo_id", 1)], unique=True)
+photos_col.create_index(
+    [("filename", "text"), ("tags", "text"), ("description", "text")],
+    name="photos_text_idx",
+)
 
 
 # ── Helpers ──────────────────────────────────────────────────────────────────
 def _pw(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+    return _ph.hash(password)
+
+
+def _check_pw(user: dict, password: str) -> bool:
+    """Verify a login, upgrading legacy SHA-256 or outdated Argon2 hashes."""
+    stored = user["password"]
+    if stored.startswith("$argon2"):
+        try:
+            _ph.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        stale = _ph.check_needs_rehash(stored)
+    else:
+        # Accounts created before Argon2 hold an unsalted SHA-256 digest.
+        if not hmac.compare_digest(stored, hashlib.sha256(password.encode()).hexdigest()):
+            return False
+        stale = True
+    if stale:
+        new_hash = _pw(password)
+        users_col.update_one(
+            {"username": user["username"]},
+            {"$set": {"password": new_hash}},
+        )
+        user["password"] = new_hash
+    return True
 
 
 def _ok_file(name: str) -> bool:
     return "." in name and name.rsplit(".", 1)[1].lower() in ALLOWED_EXT
 
 
+def _upload_s3(body, content_type: str, key: str) -> None:
+    s3_client.upload_fileobj(
+        body, S3_BUCKET, key,
+        ExtraArgs={"ContentType": content_type},
+        Config=_transfer_cfg,
+    )
+
+
+def _get_user(username: str):
+    """User record, cached for USER_CACHE_TTL seconds once found."""
+    # Misses are not cached: register() only reaches its own worker's cache,
+    # so a cached miss could hide a new account from the other workers.
+    with _user_lock:
+        user = _user_cache.get(username)
+    if user is None:
+        user = users_col.find_one({"username": username})
+        if user:
+            with _user_lock:
+                _user_cache[username] = user
+    return user
+
+
+@app.template_filter("date")
+def date_filter(ts) -> str:
+    """YYYY-MM-DD (UTC) for an epoch-ms timestamp."""
+    return datetime.datetime.fromtimestamp(ts / 1000, datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+@app.template_filter("signed_url")
+def signed_url(key: str) -> str:
+    """Presigned GET URL for an S3 key, reused until close to expiry."""
+    with _url_lock:
+        url = _url_cache.get(key)
+    if url is None:
+        url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": S3_BUCKET, "Key": key},
+            ExpiresIn=SIGNED_URL_TTL,
+        )
+        with _url_lock:
+            _url_cache[key] = url
+    return url
+
+
+def _stream_s3(item: dict) -> Response:
+    """Relay an S3 object in 64 KiB chunks rather than buffering all of it."""
+    obj = s3_client.get_object(Bucket=S3_BUCKET, Key=item["s3_key"])
+
+    def gen(body=obj["Body"]):
+        try:
+            yield from iter(lambda: body.read(65536), b"")
+        finally:
+            body.close()
+
+    return Response(gen(), headers={
+        "Content-Type": obj["ContentType"],
+        "Content-Disposition": f'attachment; filename="{item["filename"]}"',
+        "Content-Length": str(obj["ContentLength"]),
+    })
+
+
+def _epoch_ms(iso: str) -> int:
+    return int(datetime.datetime.fromisoformat(iso)
+               .replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def _upgrade_timestamps():
+    """Rewrite legacy ISO-8601 uploaded_at strings as epoch milliseconds."""
+    # Each update is conditional on the old string, so workers racing through
+    # this at boot just repeat the same write.
+    ops = [
+        UpdateOne(
+            {"_id": p["_id"], "uploaded_at": p["uploaded_at"]},
+            {"$set": {"uploaded_at": _epoch_ms(p["uploaded_at"])}},
+        )
+        for p in photos_col.find({"uploaded_at": {"$type": "string"}}, {"uploaded_at": 1})
+    ]
+    if ops:
+        photos_col.bulk_write(ops, ordered=False)
+
+
 def _init_bucket():
     try:
         s3_client.head_bucket(Bucket=S3_BUCKET)
@@ -75,6 +264,7 @@ def _init_bucket():
 
 
 _init_bucket()
+_upgrade_timestamps()
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -115,8 +305,8 @@ def login():
     if request.method == "POST":
         username = request.form["username"].strip()
         password = request.form["password"].strip()
-        user = users_col.find_one({"username": username})
-        if user and user["password"] == _pw(password):
+        user = _get_user(username)
+        if user and _check_pw(user, password):
             session["username"] = username
             flash(f"Welcome back, {username}!", "success")
             return redirect(url_for("gallery"))
@@ -137,10 +327,29 @@ def gallery():
     if "username" not in session:
         return redirect(url_for("login"))
     username = session["username"]
-    photos = list(photos_col.find({"username": username}).sort("uploaded_at", -1))
-    for p in photos:
-        p["_id"] = str(p["_id"])
-    return render_template("gallery.html", photos=photos, username=username)
+    page = max(request.args.get("page", 1, type=int), 1)
+    # One round trip for both the page slice and the total; $match + $sort
+    # run off user_time_idx ahead of the $facet.
+    result = next(photos_col.aggregate([
+        {"$match": {"username": username}},
+        {"$sort": {"uploaded_at": -1}},
+        {"$facet": {
+            "photos": [
+                {"$skip": (page - 1) * GALLERY_PAGE_SIZE},
+                {"$limit": GALLERY_PAGE_SIZE},
+                {"$project": PHOTO_FIELDS},
+            ],
+            "total": [{"$count": "n"}],
+        }},
+    ]))
+    total = result["total"][0]["n"] if result["total"] else 0
+    pages = -(-total // GALLERY_PAGE_SIZE)
+    if pages and page > pages:
+        return redirect(url_for("gallery", page=pages))
+    return render_template(
+        "gallery.html", photos=result["photos"], username=username,
+        page=page, pages=pages, total=total,
+    )
 
 
 # ── Upload ───────────────────────────────────────────────────────────────────
@@ -155,27 +364,45 @@ def upload():
             return redirect(url_for("upload"))
         tags = request.form.get("tags", "").strip()
         desc = request.form.get("description", "").strip()
-        count = 0
+        username = session["username"]
+        # Werkzeug streams are not thread-safe, so each file is buffered
+        # before its S3 upload is handed to the pool.
+        pending = []
         for f in files:
             if f and _ok_file(f.filename):
                 safe = secure_filename(f.filename)
                 pid  = str(uuid.uuid4())
-                key  = f"photos/{session['username']}/{pid}_{safe}"
-                s3_client.upload_fileobj(
-                    f.stream, S3_BUCKET, key,
-                    ExtraArgs={"ContentType": f.content_type},
-                )
-                photos_col.insert_one({
+                pending.append((BytesIO(f.read()), f.content_type, {
                     "photo_id": pid,
-                    "username": session["username"],
+                    "username": username,
                     "filename": safe,
-                    "s3_key": key,
+                    "s3_key": f"photos/{username}/{pid}_{safe}",
                     "tags": tags,
                     "description": desc,
-                    "uploaded_at": datetime.datetime.utcnow().isoformat(),
-                })
-                count += 1
-        flash(f"Uploaded {count} photo(s).", "success")
+                    "uploaded_at": int(time.time() * 1000),
+                }))
+        if not pending:
+            flash("No supported image files selected.", "danger")
+            return redirect(url_for("upload"))
+        # Metadata is written only for files that reached S3, so one failed
+        # upload doesn't sink the rest of the batch.
+        uploaded, failed = [], []
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as ex:
+            futures = {
+                ex.submit(_upload_s3, body, ct, meta["s3_key"]): meta
+                for body, ct, meta in pending
+            }
+        for fut, meta in futures.items():
+            if fut.exception():
+                app.logger.warning("S3 upload failed for %s: %s", meta["s3_key"], fut.exception())
+                failed.append(meta)
+            else:
+                uploaded.append(meta)
+        if uploaded:
+            photos_col.insert_many(uploaded)
+            flash(f"Uploaded {len(uploaded)} photo(s).", "success")
+        if failed:
+            flash("Failed to upload: " + ", ".join(m["filename"] for m in failed), "danger")
         return redirect(url_for("gallery"))
     return render_template("upload.html")
 
@@ -189,13 +416,10 @@ def search():
     username = session["username"]
     if not q:
         return render_template("search.html", photos=[], query="")
-    rgx = {"$regex": q, "$options": "i"}
-    results = list(photos_col.find({
-        "username": username,
-        "$or": [{"filename": rgx}, {"tags": rgx}, {"description": rgx}],
-    }))
-    for p in results:
-        p["_id"] = str(p["_id"])
+    results = list(photos_col.find(
+        {"username": username, "$text": {"$search": q}},
+        {**PHOTO_FIELDS, "score": {"$meta": "textScore"}},
+    ).sort([("score", {"$meta": "textScore"})]))
     return render_template("search.html", photos=results, query=q)
 
 
@@ -208,8 +432,19 @@ def download(photo_id):
     if not item:
         flash("Photo not found.", "danger")
         return redirect(url_for("gallery"))
-    obj = s3_client.get_object(Bucket=S3_BUCKET, Key=item["s3_key"])
-    return send_file(BytesIO(obj["Body"].read()), download_name=item["filename"], as_attachment=True)
+    if PROXY_DOWNLOADS:
+        return _stream_s3(item)
+    # Hand the client a short-lived S3 link instead of proxying the bytes.
+    url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": S3_BUCKET,
+            "Key": item["s3_key"],
+            "ResponseContentDisposition": f'attachment; filename="{item["filename"]}"',
+        },
+        ExpiresIn=DOWNLOAD_URL_TTL,
+    )
+    return redirect(url)
 
 
 # ── Delete ───────────────────────────────────────────────────────────────────
@@ -222,11 +457,13 @@ def delete(photo_id):
         flash("Photo not found.", "danger")
         return redirect(url_for("gallery"))
     s3_client.delete_object(Bucket=S3_BUCKET, Key=item["s3_key"])
-    photos_col.delete_one({"photo_id": photo_id})
+    with _url_lock:
+        _url_cache.pop(item["s3_key"], None)
+    photos_col.delete_one({"photo_id": photo_id, "username": session["username"]})
     flash("Photo deleted.", "success")
     return redirect(url_for("gallery"))
 
 
 # ── Entry point ──────────────────────────────────────────────────────────────
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000, debug=False)
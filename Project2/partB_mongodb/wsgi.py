@@ -0,0 +1,7 @@
+"""
+Part B  –  MongoDB app entry point for gunicorn:
+
+    gunicorn --chdir partB_mongodb wsgi:app
+"""
+
+from app import app  # noqa: F401
@@ -11,7 +11,13 @@ Usage:
 """
 
 import os
+import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
+from botocore.config import Config
 from pymongo import MongoClient, ReplaceOne
 from dotenv import load_dotenv
 
@@ -23,7 +29,18 @@ _aws = dict(
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
 )
-dynamodb = boto3.resource("dynamodb", **_aws)
+SCAN_SEGMENTS = int(os.getenv("MIGRATION_SCAN_SEGMENTS", "8"))
+
+# Room for every scan segment to hold its own connection; adaptive retries
+# back off when the parallel scan gets throttled.
+_boto_cfg = Config(
+    max_pool_connections=max(50, SCAN_SEGMENTS * 2),
+    retries={"mode": "adaptive", "max_attempts": 5},
+)
+# One session for the whole run; every scan segment shares the resource
+# built from it instead of resolving credentials per thread.
+_boto_session = boto3.session.Session(**_aws)
+dynamodb = _boto_session.resource("dynamodb", config=_boto_cfg)
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB  = os.getenv("MONGO_DB_NAME", "photo_gallery")
@@ -33,53 +50,118 @@ db        = mongo[MONGO_DB]
 TBL_USERS  = os.getenv("DYNAMO_USERS_TABLE", "PhotoGalleryUsers")
 TBL_PHOTOS = os.getenv("DYNAMO_PHOTOS_TABLE", "PhotoGalleryPhotos")
 
+BATCH_SIZE  = 1000
+QUEUE_DEPTH = 4
+
 
-def scan_all(table_name: str) -> list:
-    """Full-table scan with pagination support."""
+def iter_pages(table_name: str, total_segments: int = SCAN_SEGMENTS):
+    """Yield scan pages as the parallel segment workers fetch them.
+
+    Pages pass through a bounded queue, so scanning keeps running while the
+    caller writes to MongoDB, and at most QUEUE_DEPTH pages sit in memory.
+    """
     table = dynamodb.Table(table_name)
-    items, last_key = [], None
-    while True:
-        kwargs = {}
-        if last_key:
-            kwargs["ExclusiveStartKey"] = last_key
-        resp = table.scan(**kwargs)
-        items.extend(resp.get("Items", []))
-        last_key = resp.get("LastEvaluatedKey")
-        if not last_key:
-            break
-    return items
+    pages = queue.Queue(maxsize=QUEUE_DEPTH)
+    stop  = threading.Event()
+    done  = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def scan_segment(segment):
+        try:
+            last_key = None
+            while not stop.is_set():
+                kwargs = {"Segment": segment, "TotalSegments": total_segments}
+                if last_key:
+                    kwargs["ExclusiveStartKey"] = last_key
+                resp = table.scan(**kwargs)
+                put(resp.get("Items", []))
+                last_key = resp.get("LastEvaluatedKey")
+                if not last_key:
+                    break
+        finally:
+            put(done)
+
+    with ThreadPoolExecutor(max_workers=total_segments) as ex:
+        futures = [ex.submit(scan_segment, seg) for seg in range(total_segments)]
+        try:
+            finished = 0
+            while finished < total_segments:
+                page = pages.get()
+                if page is done:
+                    finished += 1
+                elif page:
+                    yield page
+            for fut in futures:
+                fut.result()
+        finally:
+            stop.set()
+
+
+def upsert_chunked(coll: str, docs: list, keys: tuple) -> tuple:
+    """Upsert docs in BATCH_SIZE unordered bulk writes; return (upserted, modified)."""
+    upserted = modified = 0
+    for i in range(0, len(docs), BATCH_SIZE):
+        ops = [
+            ReplaceOne({k: d[k] for k in keys}, d, upsert=True)
+            for d in docs[i:i + BATCH_SIZE]
+        ]
+        result = db[coll].bulk_write(ops, ordered=False)
+        upserted += result.upserted_count
+        modified += result.modified_count
+    return upserted, modified
+
+
+def photo_doc(item: dict) -> dict:
+    """Store uploaded_at as integer epoch milliseconds (DynamoDB yields Decimal or ISO strings)."""
+    ts = item.get("uploaded_at")
+    if isinstance(ts, str):
+        ts = (datetime.datetime.fromisoformat(ts)
+              .replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+    if ts is not None:
+        item["uploaded_at"] = int(ts)
+    return item
+
+
+def migrate_table(table_name: str, coll: str, keys: tuple, convert=None) -> tuple:
+    """Stream a DynamoDB table into a MongoDB collection; return (found, upserted, modified)."""
+    found = upserted = modified = 0
+    for page in iter_pages(table_name):
+        if convert:
+            page = [convert(item) for item in page]
+        u, m = upsert_chunked(coll, page, keys)
+        found    += len(page)
+        upserted += u
+        modified += m
+    return found, upserted, modified
 
 
 def migrate_users():
     print(f"[1/2] Scanning DynamoDB table '{TBL_USERS}' …")
-    users = scan_all(TBL_USERS)
-    print(f"      Found {len(users)} user(s).")
-    if not users:
+    found, upserted, modified = migrate_table(TBL_USERS, "users", ("username",))
+    print(f"      Found {found} user(s).")
+    if not found:
         return
-
-    ops = [
-        ReplaceOne({"username": u["username"]}, u, upsert=True)
-        for u in users
-    ]
-    result = db["users"].bulk_write(ops)
-    print(f"      Upserted {result.upserted_count}, "
-          f"modified {result.modified_count} user document(s).")
+    print(f"      Upserted {upserted}, "
+          f"modified {modified} user document(s).")
 
 
 def migrate_photos():
     print(f"[2/2] Scanning DynamoDB table '{TBL_PHOTOS}' …")
-    photos = scan_all(TBL_PHOTOS)
-    print(f"      Found {len(photos)} photo(s).")
-    if not photos:
+    found, upserted, modified = migrate_table(
+        TBL_PHOTOS, "photos", ("username", "photo_id"), convert=photo_doc,
+    )
+    print(f"      Found {found} photo(s).")
+    if not found:
         return
-
-    ops = [
-        ReplaceOne({"photo_id": p["photo_id"]}, p, upsert=True)
-        for p in photos
-    ]
-    result = db["photos"].bulk_write(ops)
-    print(f"      Upserted {result.upserted_count}, "
-          f"modified {result.modified_count} photo document(s).")
+    print(f"      Upserted {upserted}, "
+          f"modified {modified} photo document(s).")
 
 
 def main():